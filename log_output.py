@@ -1,8 +1,8 @@
 #!/usr/bin/python3
 
-import logging, os, re
-from typing import Optional
-from tornado import web
+import codecs, functools, io, logging, os, re
+from typing import Iterator, Optional
+from tornado import ioloop, iostream, web
 
 class StaticFileNonCacheHandler(web.StaticFileHandler):
     def should_return_304(self) -> bool:
@@ -14,121 +14,197 @@ class StaticFileNonCacheHandler(web.StaticFileHandler):
 
 class LogFileHandler(StaticFileNonCacheHandler):
     BLOCK_START = "@@@___@@@___@@@"
-    BLOCK_END = "===___===___==="
+    READ_CHUNK_SIZE = 64 * 1024
+    # a piece with no block start is cut after this many chunks
+    MAX_PENDING_CHUNKS = 4
+    # bytes before a chunk searched again for a block start line cut by the chunk border
+    BLOCK_START_LOOKBACK = 64
+
+    PAGE_HEADER = (
+        '<html><head><title>PodTube Log ({log_file})</title>'
+        '<link rel="shortcut icon" href="/favicon.ico">'
+        '<link rel="stylesheet" type="text/css" href="/log.css">'
+        '<meta charset="UTF-8">'
+        '</head><body><pre class="logger">'
+    )
+    PAGE_FOOTER = '</pre></body></html>'
+
+    # podtube.py chdirs into its own directory, which is where this module lives
+    PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "")
+
+    ESCAPE_REPLACEMENTS = ((b"<", b"&lt;"), (b">", b"&gt;"), (b"@", b"&#64;"), (b"=", b"&#61;"))
+
+    BLOCK_START_PATTERN = re.compile(r"^[ \t]*(\d+-\d+-\d+ \d+:\d+:\d+)", flags = re.MULTILINE)
+    BLOCK_START_BYTES_PATTERN = re.compile(BLOCK_START_PATTERN.pattern.encode(), flags = re.MULTILINE)
+    BLOCK_START_REPLACEMENT = BLOCK_START + r"\g<0>"
+    NUMBERS_PATTERN = re.compile(
+        r"(?=[\d&])(?# every alternative starts with a digit or '&', reject other positions before branching \
+        )(?:(?P<ip>(?:\d+\.){3}\d+)|(?# \
+            )(?P<date>(?:(?:\d+-){2}|(?:\d+\/){1,2}|(?:\d+\.){2})\d+)|(?# \
+            )(?P<time>(?:\d+:){1,2}\d+(?:[,.]\d+)?)|(?# \
+            )(?P<html>&#\d+;)|(?# \
+            )\b(?P<hex>0x[0-9a-fA-F]+)\b|(?# \
+            )\b(?P<bin>0b[01]+)\b|(?# \
+            )\b(?P<simple_number>\d+(?:[,.]\d+)?)(?=[\w-]{0,3}(?:[^\w-]|$))(?# \
+        ))"
+    )
+    NUMBER_STYLE_CLASSES = {
+        "ip": "log-ip",
+        "date": "log-date",
+        "time": "log-time",
+        "hex": "log-number log-number-hex",
+        "bin": "log-number log-number-bin",
+        "simple_number": "log-number log-number-simple",
+    }
+    LOG_LEVEL_TAGS = ("[CRITICAL]", "[ERROR]", "[WARNING]", "[INFO]", "[DEBUG]")
+    LOG_LEVEL_CLASSES = {tag: f"log-{tag[1:-1].lower()}" for tag in LOG_LEVEL_TAGS}
+    DIGIT_PATTERN = re.compile(r"\d")
+    # Backslash pairs can only be followed by a quote and quoted bodies consume an escape as a unit,
+    # so no alternative overlaps and the pattern never backtracks: possessive quantifiers would change nothing.
+    STRING_PATTERN = re.compile(r"""(?<!\\)(\\\\)*("(?:[^"\\]|\\[\s\S])*"|'(?:[^'\\]|\\[\s\S])*')""")
 
     @classmethod
-    def escape(cls, string: str) -> str:
-        return string.replace("<", "&lt;").replace(">", "&gt;").replace("@", "&#64;").replace("=", "&#61;")
+    def escape(cls, data: bytes) -> bytes:
+        for char, replacement in cls.ESCAPE_REPLACEMENTS:
+            data = data.replace(char, replacement)
+        return data
 
     @classmethod
     def add_block_start_border(cls, string: str) -> str:
-        return re.sub(r"^[ \t]*(\d+-\d+-\d+ \d+:\d+:\d+)", rf"{cls.BLOCK_START}\g<0>", string, flags = re.MULTILINE)
+        return cls.BLOCK_START_PATTERN.sub(cls.BLOCK_START_REPLACEMENT, string)
 
     @classmethod
-    def add_block_end_borders(cls, string):
-        return re.sub(rf"^{cls.BLOCK_START}.*?(?=\n*(?:{cls.BLOCK_START}|\Z))", rf"\g<0>{cls.BLOCK_END}", string, flags = re.MULTILINE | re.DOTALL)
+    def add_log_level_style(cls, string: str):
+        """
+        Wrap the whole block, except its trailing newlines, into a span styled by the first log level tag found in it.
+        """
+        level_index = -1
+        level_tag = None
+        for tag in cls.LOG_LEVEL_TAGS:
+            index = string.find(tag)
+            if index != -1 and (level_tag is None or index < level_index):
+                level_index = index
+                level_tag = tag
+        if level_tag is None:
+            return string
+        content = string.rstrip("\n")
+        return f"<span class='{cls.LOG_LEVEL_CLASSES[level_tag]}'>{content}</span>{string[len(content):]}"
 
     @classmethod
-    def add_block_borders(cls, string: str) -> str:
-        string = cls.add_block_start_border(string)
-        string = cls.add_block_end_borders(string)
-        return string
+    def numbers_replacer(cls, match_obj: re.Match[str]) -> str:
+        style_class = cls.NUMBER_STYLE_CLASSES.get(match_obj.lastgroup)
+        if style_class is not None:
+            return "<span class='" + style_class + "'>" + match_obj.group() + "</span>"
+        return match_obj.group()
 
     @classmethod
-    def remove_block_borders(cls, string: str) -> str:
-        return string.replace(cls.BLOCK_START, "").replace(cls.BLOCK_END, "")
+    def add_numbers_style(cls, string: str):
+        if cls.DIGIT_PATTERN.search(string) is None:
+            return string
+        return cls.NUMBERS_PATTERN.sub(cls.numbers_replacer, string)
 
     @classmethod
-    def add_braces(cls, string: str) -> str:
-        return string.replace("\n", "<br />\n")
+    def string_replacer(cls, match_obj: re.Match[str]) -> str:
+        prefix = match_obj.group(1)
+        return f"{'' if prefix is None else prefix}<span class='log-string'>{match_obj.group(2)}</span>"
 
     @classmethod
-    def add_log_level_style(cls, string: str, use_block_borders: bool = True):
-        def replacer(match_obj: re.Match[str]):
-            if match_obj.group(1) is not None:
-                return f"<span class='log-{match_obj.group(1).lower()}'>{match_obj.group()}</span>"
-            return match_obj.group()
-
-        if use_block_borders:
-            return re.sub(rf"^{cls.BLOCK_START}.*?\[(CRITICAL|ERROR|WARNING|INFO|DEBUG)\].*?{LogFileHandler.BLOCK_END}", replacer, string, flags = re.MULTILINE | re.DOTALL)
-        return re.sub(rf"^.*?\[(CRITICAL|ERROR|WARNING|INFO|DEBUG)\].*?(?=\n*\Z)", replacer, string, flags = re.MULTILINE | re.DOTALL)
+    def add_string_style(cls, string: str):
+        if '"' not in string and "'" not in string:
+            return string
+        return cls.STRING_PATTERN.sub(cls.string_replacer, string)
 
     @classmethod
-    def add_numbers_style(cls, string: str):
-        def replacer(match_obj: re.Match[str]):
-            if match_obj.group("html") is not None:
-                return match_obj.group()
-            style_class = None
-            if match_obj.group("ip") is not None:
-                style_class = "log-ip"
-            elif match_obj.group("date") is not None:
-                style_class = "log-date"
-            elif match_obj.group("time") is not None:
-                style_class = "log-time"
-            elif match_obj.group("number") is not None:
-                style_class = "log-number"
-                if match_obj.group("hex") is not None:
-                    style_class += " log-number-hex"
-                if match_obj.group("bin") is not None:
-                    style_class += " log-number-bin"
-                if match_obj.group("simple_number") is not None:
-                    style_class += " log-number-simple"
-
-            if style_class is not None:
-                return "<span class='" + style_class + "'>" + match_obj.group() + "</span>"
-            return match_obj.group()
-
-        return re.sub(
-            r"(?:(?P<ip>(?:\d+\.){3}\d+)|(?# \
-                )(?P<date>(?:(?:\d+-){2}|(?:\d+\/){1,2}|(?:\d+\.){2})\d+)|(?# \
-                )(?P<time>(?:\d+:){1,2}\d+(?:[,.]\d+)?)|(?# \
-                )(?P<html>&#\d+;)|(?# \
-                )(?P<number>\b(?:(?# \
-                    )(?P<hex>0x[0-9a-fA-F]+)\b|(?# \
-                    )(?P<bin>0b[01]+)\b|(?# \
-                    )(?P<simple_number>\d+(?:[,.]\d+)?)(?=[\w-]{0,3}(?:[^\w-]|$))(?# \
-                )))(?# \
-            ))",
-            replacer,
-            string
-        )
+    def read_blocks(cls, path: str) -> Iterator[bytes]:
+        """
+        Read the log file and yield raw pieces of at least READ_CHUNK_SIZE bytes,
+        each ending right before a block start line.
+        A piece that grows past MAX_PENDING_CHUNKS chunks without one is cut after its last line.
+        """
+        with open(path, "rb") as file:
+            # bounded reads, not mmap: the log may be truncated while a slow client is served,
+            # and touching a truncated mapping kills the process with SIGBUS, a short read does not
+            remaining = os.fstat(file.fileno()).st_size
+            chunks = []
+            size = 0
+            first = True
+            while remaining > 0:
+                chunk = file.read(min(cls.READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                if first and chunk.startswith(codecs.BOM_UTF8):
+                    chunk = chunk[len(codecs.BOM_UTF8):]
+                first = False
+                # earlier bytes were already searched, only a block start cut by the chunk border is looked up again
+                lookback = chunks[-1][-cls.BLOCK_START_LOOKBACK:] if chunks else b""
+                window = lookback + chunk
+                window_start = size - len(lookback)
+                chunks.append(chunk)
+                size += len(chunk)
+                # never from 0, '^' must see the byte before the window to tell a line start
+                match = cls.BLOCK_START_BYTES_PATTERN.search(window, max(cls.READ_CHUNK_SIZE - window_start, 1))
+                if match is not None:
+                    pending = b"".join(chunks)
+                    split = window_start + match.start()
+                    while match is not None:
+                        yield pending[:split]
+                        pending = pending[split:]
+                        match = cls.BLOCK_START_BYTES_PATTERN.search(pending, cls.READ_CHUNK_SIZE)
+                        if match is not None:
+                            split = match.start()
+                    chunks = [pending]
+                    size = len(pending)
+                elif size >= cls.MAX_PENDING_CHUNKS * cls.READ_CHUNK_SIZE:
+                    # no block start in sight, e.g. a log format without a timestamp, don't hold the page until EOF
+                    pending = b"".join(chunks)
+                    split = cls.last_line_end(pending)
+                    yield pending[:split]
+                    chunks = [pending[split:]]
+                    size = len(chunks[0])
+            if size:
+                yield b"".join(chunks)
+
+    @staticmethod
+    def last_line_end(data: bytes) -> int:
+        """
+        Find where to cut the data so the first part ends with a whole line,
+        or at least with a whole UTF-8 character if there is no line break.
+        """
+        index = data.rfind(b"\n") + 1
+        if index > 0:
+            return index
+        index = len(data) - 1
+        while index > 0 and data[index] & 0xC0 == 0x80:
+            index -= 1
+        return index or len(data)
 
     @classmethod
-    def add_string_style(cls, string: str):
-        def replacer(match_obj: re.Match[str]):
-            prefix = match_obj.group(1)
-            return f"{'' if prefix is None else prefix}<span class='log-string'>{match_obj.group(2)}</span>"
-
-        return re.sub(r"(?<!\\)(\\\\)*((?P<quote>(?P<is_double>\")|')(?:(?:\\\\)*(?(is_double)[^\"\\]*|[^\'\\]*)(?:\\\\)*(?:\\[^\\])?)*(?P=quote))", replacer, string)
+    def style_block(cls, block: str) -> str:
+        block = cls.add_string_style(block)
+        block = cls.add_numbers_style(block)
+        return cls.add_log_level_style(block)
 
     @classmethod
-    def log_style(cls, string: str, add_br: bool = False) -> str:
-        string = cls.escape(string)
-        # string = cls.add_block_borders(string)
-        # string = cls.add_string_style(string)
-        # string = cls.add_numbers_style(string)
-        # string = cls.add_log_level_style(string)
-        # string = cls.remove_block_borders(string)
+    def log_style(cls, data: bytes) -> str:
+        string = cls.escape(data).decode("utf-8").replace("\r\n", "\n")
         string = cls.add_block_start_border(string)
-        blocks = string.split(cls.BLOCK_START)
-        for i in range(len(blocks)):
-            block = blocks[i]
-            block = cls.add_string_style(block)
-            block = cls.add_numbers_style(block)
-            block = cls.add_log_level_style(block, False)
-            blocks[i] = block
-        string = "".join(blocks)
-        if add_br:
-            string = cls.add_braces(string)
-        return string
+        buffer = io.StringIO()
+        for block in string.split(cls.BLOCK_START):
+            buffer.write(cls.style_block(block))
+        return buffer.getvalue()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def normalize_dir(path: str) -> str:
+        path = os.path.abspath(path)
+        if not path.endswith(os.path.sep):
+            path += os.path.sep
+        return path
 
     def validate_absolute_path(self, root: str, absolute_path: str) -> Optional[str]:
-        root = os.path.abspath(root)
-        if not root.endswith(os.path.sep):
-            root += os.path.sep
-        project_root = os.path.abspath(".")
-        if not project_root.endswith(os.path.sep):
-            project_root += os.path.sep
+        root = LogFileHandler.normalize_dir(root)
+        project_root = LogFileHandler.PROJECT_ROOT
         if not (root).startswith(project_root):
             raise web.HTTPError(403, "Log file is not in root directory")
         if project_root == root:
@@ -142,7 +218,7 @@ class LogFileHandler(StaticFileNonCacheHandler):
                 raise web.HTTPError(403, "Log folder is root directory, but default_filename is not set")
         return super().validate_absolute_path(root, absolute_path)
 
-    def get(self, path: str):
+    async def get(self, path: str):
         self.path = self.parse_url_path(path)
         del path  # make sure we don't refer to path instead of self.path again
         absolute_path = self.get_absolute_path(self.root, self.path)
@@ -152,15 +228,14 @@ class LogFileHandler(StaticFileNonCacheHandler):
             return
         log_file = os.path.basename(self.absolute_path)
         # logging.debug('Get log (path: %s) from (%s)', log_file, self.request.remote_ip)
-        self.write('<html><head><title>PodTube Log (')
-        self.write(log_file)
-        self.write(')</title>')
-        self.write('<link rel="shortcut icon" href="/favicon.ico">')
-        self.write('<link rel="stylesheet" type="text/css" href="/log.css">')
-        self.write('<meta charset="UTF-8">')
-        self.write('</head><body><pre class="logger">')
-        with open(self.absolute_path) as text:
-            self.write(
-                LogFileHandler.log_style(text.read().replace("\xEF\xBB\xBF", "", 1))
-            )
-        self.write('</pre></body></html>')
+        self.write(LogFileHandler.PAGE_HEADER.format(log_file=log_file))
+        io_loop = ioloop.IOLoop.current()
+        for part in LogFileHandler.read_blocks(self.absolute_path):
+            # style off the ioloop so a large log does not stall other requests
+            part = await io_loop.run_in_executor(None, LogFileHandler.log_style, part)
+            self.write(part)
+            try:
+                await self.flush()
+            except iostream.StreamClosedError:
+                return
+        self.write(LogFileHandler.PAGE_FOOTER)
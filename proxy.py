@@ -1,14 +1,42 @@
+import datetime
+import functools
+import http.cookiejar
 import logging
 import requests
 import utils
-import re
 
+from collections import OrderedDict
 from configparser import ConfigParser
-from tornado import web
+from requests import adapters
+from tornado import ioloop, iostream, web
 
 HTTP_PROXY = None
 HTTPS_PROXY = None
 PROXIES = None
+SESSION = None
+SESSION_POOL_SIZE = 32
+# (connect, read) seconds, so a stalled upstream can't hold an executor thread forever;
+# the read timeout also applies to every chunk read of a streamed body
+REQUEST_TIMEOUT = (5, 30)
+RSS_CACHE_TIME = None
+RSS_CACHE_SIZE = 256
+
+# (address, arguments) -> {'body', 'etag', 'last_modified', 'expire'}
+rss_cache = OrderedDict()
+
+URL_QUOTES = (b'"', b"&#34;")
+SKIPPED_REQUEST_HEADERS = frozenset({"host"})
+# RFC 7230 section 6.1: these describe the upstream connection and must not be forwarded
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+})
 
 def get_env_or_config_option(conf: ConfigParser, env_name: str, config_name: str, default_value = None):
     """
@@ -35,16 +63,47 @@ def init(conf: ConfigParser):
     Returns:
         None
     """
-    global HTTP_PROXY, HTTPS_PROXY, PROXIES
-    HTTP_PROXY  = get_env_or_config_option(conf, "PROXY_HTTP_PROXY" , "proxy_http_proxy" , default_value=None)
-    HTTPS_PROXY = get_env_or_config_option(conf, "PROXY_HTTPS_PROXY", "proxy_https_proxy", default_value=None)
+    global HTTP_PROXY, HTTPS_PROXY, PROXIES, SESSION, RSS_CACHE_TIME
+    HTTP_PROXY     =     get_env_or_config_option(conf, "PROXY_HTTP_PROXY"    , "proxy_http_proxy"    , default_value=None)
+    HTTPS_PROXY    =     get_env_or_config_option(conf, "PROXY_HTTPS_PROXY"   , "proxy_https_proxy"   , default_value=None)
+    RSS_CACHE_TIME = int(get_env_or_config_option(conf, "PROXY_RSS_CACHE_TIME", "proxy_rss_cache_time", default_value=60000)) # 1 minute
 
-    if any(proxy is not None for proxy in [HTTP_PROXY, HTTPS_PROXY]):
-        PROXIES = {}
+    proxies = {}
     if HTTP_PROXY is not None:
-        PROXIES["http"] = HTTP_PROXY
+        proxies["http"] = HTTP_PROXY
     if HTTPS_PROXY is not None:
-        PROXIES["https"] = HTTPS_PROXY
+        proxies["https"] = HTTPS_PROXY
+    PROXIES = proxies or None
+
+    if SESSION is not None:
+        SESSION.close()
+    SESSION = requests.Session()
+    # the session is shared by all clients, so never carry cookies from one upstream response into other requests
+    SESSION.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    adapter = adapters.HTTPAdapter(pool_connections=SESSION_POOL_SIZE, pool_maxsize=SESSION_POOL_SIZE)
+    SESSION.mount("http://", adapter)
+    SESSION.mount("https://", adapter)
+    if PROXIES is not None:
+        SESSION.proxies.update(PROXIES)
+
+def rewrite_urls(body: bytes, protocol: str, prefix: bytes) -> bytes:
+    """
+    Insert the proxy prefix in front of every quoted http(s) URL in the body.
+
+    Args:
+        body (bytes): The raw body to rewrite.
+        protocol (str): The scheme the prefix starts with ("http" or "https").
+        prefix (bytes): The proxy URL to insert.
+
+    Returns:
+        The rewritten body.
+    """
+    # rewrite the prefix's own scheme first, so the other pass can't match an inserted prefix
+    schemes = (b"https://", b"http://") if protocol == "https" else (b"http://", b"https://")
+    for scheme in schemes:
+        for quote in URL_QUOTES:
+            body = body.replace(quote + scheme, quote + prefix + scheme)
+    return body
 
 class ProxyRssHandler(web.RequestHandler):
 
@@ -56,55 +115,74 @@ class ProxyRssHandler(web.RequestHandler):
         """
         self.proxy_handler_path = proxy_handler_path
 
-    def get(self, address: str) -> None:
+    async def get(self, address: str) -> None:
 
         logging.info(f"Get proxy-rss for {address}")
         if self.request.arguments:
             logging.debug(f"Get proxy-rss for {address}?{self.request.arguments}")
         
-        response = requests.get(
-            url=address,
-            params=self.request.arguments,
-            proxies=PROXIES
-        )
-        if (response.status_code != 200):
-            logging.error('Error get RSS: %s (%d)', response.reason, response.status_code)
-            self.send_error(reason='Error get RSS')
-            return
-
-        self.write(re.sub(r"(\"|\&\#34\;)(https?://)", repl=rf"\g<1>{self.request.protocol}://{self.request.host}{self.proxy_handler_path}\g<2>", string=response.text, flags=re.MULTILINE))
+        # the upstream body is cached, the rewrite depends on the host the client used
+        key = (address, tuple(sorted((name, tuple(values)) for (name, values) in self.request.arguments.items())))
+        entry = rss_cache.get(key)
+        current_time = datetime.datetime.now()
+        if entry is None or entry['expire'] <= current_time:
+            headers = {}
+            if entry is not None and entry['etag'] is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry is not None and entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+            response = await ioloop.IOLoop.current().run_in_executor(None, functools.partial(
+                SESSION.get,
+                url=address,
+                params=self.request.arguments,
+                headers=headers,
+                proxies=PROXIES,
+                timeout=REQUEST_TIMEOUT,
+            ))
+            if response.status_code == 304 and entry is not None:
+                logging.debug('RSS is not modified: %s', address)
+            elif response.status_code != 200:
+                logging.error('Error get RSS: %s (%d)', response.reason, response.status_code)
+                self.send_error(reason='Error get RSS')
+                return
+            else:
+                entry = {
+                    'body': response.content,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }
+            entry['expire'] = current_time + datetime.timedelta(milliseconds=RSS_CACHE_TIME)
+            rss_cache[key] = entry
+        rss_cache.move_to_end(key)
+        while len(rss_cache) > RSS_CACHE_SIZE:
+            rss_cache.popitem(last=False)
+
+        prefix = f"{self.request.protocol}://{self.request.host}{self.proxy_handler_path}".encode()
+        self.write(rewrite_urls(entry['body'], self.request.protocol, prefix))
 
 class ProxyHandler(web.RequestHandler):
     CONTENT_CHUNK_SIZE = 10 * 1024
 
-    def make_request(self, address: str, method: str) -> None:
-        global PROXIES
-
+    async def make_request(self, address: str, method: str) -> None:
         logging.info(f"Make request ({method}): {address=}")
         if self.request.arguments:
             logging.debug(f"Make request ({method}): {address=}; {self.request.arguments=}")
         
-        headers = None
-        for (header_key, header_value) in self.request.headers.items():
-            if not headers:
-                headers = {}
-            if str(header_key).lower() != "host":
-                headers[header_key] = header_value
-
-        cookies = None
-        for (cookie_key, cookie_value) in self.request.cookies.items():
-            if not cookies:
-                cookies = {}
-            cookies[cookie_key] = cookie_value.output()
-
-        files = None
-        for (files_key, files_value) in self.request.files.items():
-            if not files:
-                files = []
-            for file_info in files_value:
-                files.append((files_key, (file_info.filename, file_info.body, file_info.content_type)))
-
-        response = requests.request(
+        headers = {
+            header_key: header_value
+            for (header_key, header_value) in self.request.headers.items()
+            if header_key.lower() not in SKIPPED_REQUEST_HEADERS
+        }
+        cookies = {cookie_key: cookie_value.output() for (cookie_key, cookie_value) in self.request.cookies.items()}
+        files = [
+            (files_key, (file_info.filename, file_info.body, file_info.content_type))
+            for (files_key, files_value) in self.request.files.items()
+            for file_info in files_value
+        ]
+
+        io_loop = ioloop.IOLoop.current()
+        response = await io_loop.run_in_executor(None, functools.partial(
+            SESSION.request,
             method=method,
             url=address,
             params=self.request.arguments,
@@ -113,47 +191,44 @@ class ProxyHandler(web.RequestHandler):
             cookies=cookies,
             files=files,
             proxies=PROXIES,
-        )
-
-        self.set_status(response.status_code, response.reason)
-        has_content = not (response.status_code in (204, 304) or (100 <= response.status_code < 200))
-
-        for (header_key, header_value) in response.headers.items():
-            if has_content or header_key != 'content-length':
-                self.set_header(header_key, header_value)
-
-        if has_content:
-            content = response.content
-            self.write(content)
-
-        for cookie in response.cookies:
-            self.set_cookie(
-                name=cookie.name,
-                value=cookie.value,
-                domain=cookie.domain,
-                expires=cookie.expires,
-                path=cookie.path
-            )
+            timeout=REQUEST_TIMEOUT,
+            stream=True,
+        ))
+
+        with response:
+            self.set_status(response.status_code, response.reason)
+            has_content = not (response.status_code in (204, 304) or (100 <= response.status_code < 200))
+
+            skipped_headers = HOP_BY_HOP_HEADERS if has_content else HOP_BY_HOP_HEADERS | {"content-length"}
+            for (header_key, header_value) in response.headers.items():
+                if header_key.lower() not in skipped_headers:
+                    self.set_header(header_key, header_value)
+
+            for cookie in response.cookies:
+                self.set_cookie(
+                    name=cookie.name,
+                    value=cookie.value,
+                    domain=cookie.domain,
+                    expires=cookie.expires,
+                    path=cookie.path
+                )
+
+            if has_content:
+                # pass the body through undecoded, it has to match the forwarded Content-Encoding and Content-Length
+                chunks = response.raw.stream(self.CONTENT_CHUNK_SIZE, decode_content=False)
+                while True:
+                    chunk = await io_loop.run_in_executor(None, next, chunks, None)
+                    if chunk is None:
+                        break
+                    try:
+                        self.write(chunk)
+                        await self.flush()
+                    except iostream.StreamClosedError:
+                        return
 
         self.finish()
 
-    def get(self, address: str) -> None:
-        self.make_request(address, "get")
-    
-    def post(self, address: str) -> None:
-        self.make_request(address, "post")
-
-    def head(self, address: str) -> None:
-        self.make_request(address, "head")
-
-    def delete(self, address: str) -> None:
-        self.make_request(address, "delete")
-
-    def patch(self, address: str) -> None:
-        self.make_request(address, "patch")
-
-    def put(self, address: str) -> None:
-        self.make_request(address, "put")
+    def handle_request(self, address: str):
+        return self.make_request(address, self.request.method.lower())
 
-    def options(self, address: str) -> None:
-        self.make_request(address, "options")
+    get = post = head = delete = patch = put = options = handle_request
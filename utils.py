@@ -1,51 +1,66 @@
 from configparser import ConfigParser, NoOptionError, NoSectionError
 import logging
 import os
+import re
 from asyncio import sleep
+from collections import OrderedDict
 from datetime import datetime
 import sys
-from urllib.parse import urlencode
+from urllib.parse import parse_qs, urlencode, urlsplit
 
 from pytube import YouTube
 
-video_links = dict()
+video_links = OrderedDict()
+video_links_max_size = 1024
 metric_chart = {
-    'k': 3,  # kilo
-    'M': 6,  # Mega
-    'G': 9,  # Giga
-    'T': 12  # Tera
+    'k': 10 ** 3,  # kilo
+    'M': 10 ** 6,  # Mega
+    'G': 10 ** 9,  # Giga
+    'T': 10 ** 12  # Tera
 }
+TRUE_STRINGS = frozenset({'1', 'true', 't', 'yes', 'y', 'on'})
+RESOLUTION_PATTERN = re.compile(r"\d+")
 
 def parametrize(url, params):
     return url + '?' + urlencode(params)
 
 def get_resolution(yt_video):
-    return int(''.join(filter(str.isdigit, yt_video.resolution[:-1])))
+    return int(RESOLUTION_PATTERN.match(yt_video.resolution).group())
 
 def get_youtube_url(video_id):
-    if video_id in video_links and video_links[video_id]['expire'] > datetime.now():
-        return video_links[video_id]['url']
+    if video_id in video_links:
+        if video_links[video_id]['expire'] > datetime.now():
+            video_links.move_to_end(video_id)
+            return video_links[video_id]['url']
+        del video_links[video_id]
     yt_video = YouTube(f'http://www.youtube.com/watch?v={video_id}')
     video_url = yt_video.streams.get_highest_resolution().url
-    parts = {part.split('=')[0]: part.split('=')[1] for part in video_url.split('?')[-1].split('&')}
-    link = {'url': video_url, 'expire': datetime.fromtimestamp(int(parts['expire']))}
+    query = parse_qs(urlsplit(video_url).query)
+    link = {'url': video_url, 'expire': datetime.fromtimestamp(int(query['expire'][0]))}
     video_links[video_id] = link
+    while len(video_links) > video_links_max_size:
+        video_links.popitem(last=False)
     return link['url']
 
 def metric_to_base(metric):
-    return int(metric[:-1]) * (10 ** metric_chart[metric[-1]])
+    return int(metric[:-1]) * metric_chart[metric[-1]]
 
 async def get_total_storage(directory='.'):
     total_storage = 0
-    for root, directories, files in os.walk(directory):
-        for file in files:
-            total_storage += os.path.getsize(os.path.join(root, file))
-            await sleep(0)
+    directories = [directory]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                else:
+                    total_storage += entry.stat().st_size
+        await sleep(0)
     return total_storage
 
 def convert_to_bool(input) -> bool:
-    if type(input) is str:
-        return input.lower() in ['1', 'true', 't', 'yes', 'y', 'on']
+    if isinstance(input, str):
+        return input.lower() in TRUE_STRINGS
     return bool(input)
 
 def get_env_or_config_option(conf: ConfigParser, env_name: str, config_name: str, config_section: str, conf_raw: bool = True, default_value = None):
@@ -4,40 +4,85 @@ content. It includes classes such as VideoHandler, AudioHandler, ClearCacheHandl
 which handle different types of requests related to YouTube content.
 """
 import datetime
+import functools
+import hashlib
+import html
+import http.cookiejar
 import logging
 import os
 import psutil
+import re
+import shutil
 import time
 import glob
+import gzip
 import requests
 import utils
+from collections import OrderedDict
 from configparser import ConfigParser, NoSectionError, NoOptionError
-from pathlib import Path
 from feedgen.feed import FeedGenerator
 from pytube import YouTube, exceptions
+from requests import adapters
 from tornado import gen, httputil, ioloop, iostream, process, web
-from tornado.locks import Semaphore
+from tornado.locks import Event, Semaphore
+from urllib3.util import Retry
+
+# orjson parses the API pages several times faster, but is optional
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 KEY = None
 CLEANUP_PERIOD = None
-CONVERT_VIDEO_PERIOD = None
 AUDIO_EXPIRATION_TIME = None
 AUTOLOAD_NEWEST_AUDIO = None
 HTTP_PROXY = None
 HTTPS_PROXY = None
 PROXIES = None
 USE_OAUTH = False
+SESSION = None
+SESSION_POOL_SIZE = 32
+# (connect, read) seconds, so a stalled youtube request can't hold an executor thread forever
+REQUEST_TIMEOUT = (5, 30)
+FFMPEG_BIN = "ffmpeg"
 
 AUDIO_DIR = "./audio"
 VIDEO_DIR = "./video"
 
-video_links = {}
-playlist_feed = {}
-channel_feed = {}
-channel_name_to_id = {}
+video_links = OrderedDict()
+playlist_feed = OrderedDict()
+channel_feed = OrderedDict()
+channel_name_to_id = OrderedDict()
+channel_info = OrderedDict()
+# entries kept by each of the caches above, least recently used go first
+CACHE_MAX_SIZE = 1024
+# last time each cached mp3 was touched, the ctime is refreshed at most once per AUDIO_TOUCH_INTERVAL
+audio_last_touch = {}
+# seconds
+AUDIO_TOUCH_INTERVAL = 10 * 60
 
 __version__ = 'v2023.04.21.5'
 
+YOUTUBE_WATCH_URL = 'https://www.youtube.com/watch?v='
+
+# partial responses, limited to what the feeds read
+PLAYLIST_FIELDS = 'items/snippet(title,description,channelId,channelTitle,thumbnails)'
+PLAYLIST_ITEM_FIELDS = 'nextPageToken,items/snippet(title,description,publishedAt,channelTitle,thumbnails,resourceId/videoId)'
+UPLOAD_ITEM_FIELDS = 'nextPageToken,items(snippet(title,description,publishedAt,channelId,channelTitle,thumbnails),contentDetails/videoId)'
+
+# YouTube's standard thumbnail keys, widest first
+THUMBNAIL_SIZES = ('maxres', 'standard', 'high', 'medium', 'default')
+
+# bytes read and flushed per step when serving audio, the flush keeps the write buffer bounded
+AUDIO_CHUNK_SIZE = 1024 ** 2
+
+# the <link rel="canonical"> tag of a channel page, and the href inside it
+CANONICAL_LINK_PATTERN = re.compile(rb"""<link\b[^>]*\brel=["']?canonical\b[^>]*>""", flags = re.IGNORECASE)
+HREF_PATTERN = re.compile(rb"""\bhref=["']?([^"'\s>]+)""", flags = re.IGNORECASE)
+
+SIZE_UNITS = ('B', 'KiB', 'MiB', 'GiB', 'TiB')
+
 conversion_queue = {}
 converting_lock = Semaphore(2)
 
@@ -66,12 +111,11 @@ def init(conf: ConfigParser):
     Returns:
         None
     """
-    global KEY, CLEANUP_PERIOD, CONVERT_VIDEO_PERIOD, AUDIO_EXPIRATION_TIME, AUTOLOAD_NEWEST_AUDIO, HTTP_PROXY, HTTPS_PROXY, PROXIES, USE_OAUTH
+    global FFMPEG_BIN, SESSION, KEY, CLEANUP_PERIOD, AUDIO_EXPIRATION_TIME, AUTOLOAD_NEWEST_AUDIO, HTTP_PROXY, HTTPS_PROXY, PROXIES, USE_OAUTH
     KEY                   = str(get_env_or_config_option(conf, "YT_API_KEY"               , "yt_api_key"               , default_value=None))
     HTTP_PROXY            =     get_env_or_config_option(conf, "YT_HTTP_PROXY"            , "yt_http_proxy"            , default_value=None)
     HTTPS_PROXY           =     get_env_or_config_option(conf, "YT_HTTPS_PROXY"           , "yt_https_proxy"           , default_value=None)
     CLEANUP_PERIOD        = int(get_env_or_config_option(conf, "YT_CLEANUP_PERIOD"        , "yt_cleanup_period"        , default_value=600000)) # 10 minutes
-    CONVERT_VIDEO_PERIOD  = int(get_env_or_config_option(conf, "YT_CONVERT_VIDEO_PERIOD"  , "yt_convert_video_period"  , default_value=1000)) # 1 second
     AUDIO_EXPIRATION_TIME = int(get_env_or_config_option(conf, "YT_AUDIO_EXPIRATION_TIME" , "yt_audio_expiration_time" , default_value=259200000)) # 3 days
     AUTOLOAD_NEWEST_AUDIO =     get_env_or_config_option(conf, "YT_AUTOLOAD_NEWEST_AUDIO" , "yt_autoload_newest_audio" , default_value=True)
     USE_OAUTH             =     get_env_or_config_option(conf, "YT_USE_OAUTH"             , "yt_use_oauth"             , default_value=False)
@@ -86,14 +130,170 @@ def init(conf: ConfigParser):
     if HTTPS_PROXY is not None:
         PROXIES["https"] = HTTPS_PROXY
 
+    if SESSION is not None:
+        SESSION.close()
+    SESSION = requests.Session()
+    # the session is shared by all handlers, so never carry cookies from one youtube response into other requests
+    SESSION.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    adapter = adapters.HTTPAdapter(
+        pool_connections=SESSION_POOL_SIZE,
+        pool_maxsize=SESSION_POOL_SIZE,
+        max_retries=Retry(total=3, backoff_factor=0.2)
+    )
+    SESSION.mount("http://", adapter)
+    SESSION.mount("https://", adapter)
+    if PROXIES is not None:
+        SESSION.proxies.update(PROXIES)
+
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path is None:
+        logging.error("ffmpeg is not found in PATH, converting video to audio will fail")
+    else:
+        FFMPEG_BIN = ffmpeg_path
+
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    os.makedirs(VIDEO_DIR, exist_ok=True)
+
     ioloop.PeriodicCallback(
         callback=cleanup,
         callback_time=CLEANUP_PERIOD
     ).start()
-    ioloop.PeriodicCallback(
-        callback=convert_videos,
-        callback_time=CONVERT_VIDEO_PERIOD
-    ).start()
+
+def api_get(url: str, params: dict):
+    """
+    Send a GET request to the YouTube Data API in the default executor, so the ioloop keeps serving.
+
+    Args:
+        url (str): The API endpoint.
+        params (dict): The query parameters.
+
+    Returns:
+        A future resolving to the requests.Response.
+    """
+    return ioloop.IOLoop.current().run_in_executor(None, functools.partial(SESSION.get, url, params=params, proxies=PROXIES, timeout=REQUEST_TIMEOUT))
+
+def get_playlist_items(playlist_id: str, part: str, fields: str, page_token: str, max_items: int, items_count: int):
+    """
+    Request one page of playlist items, sized to what is still missing from the feed.
+
+    Args:
+        playlist_id (str): The playlist to read.
+        part (str): The snippet parts to request.
+        fields (str): The partial response fields to request.
+        page_token (str): The page token returned by the previous page.
+        max_items (int): The feed length limit, less than 1 for no limit.
+        items_count (int): The number of items already in the feed.
+
+    Returns:
+        A future resolving to the requests.Response.
+    """
+    return api_get(
+        'https://www.googleapis.com/youtube/v3/playlistItems',
+        {
+            'part': part,
+            'fields': fields,
+            'maxResults': 50 if max_items < 1 or max_items - items_count > 50 else max_items - items_count,
+            'playlistId': playlist_id,
+            'key': KEY,
+            'pageToken': page_token
+        }
+    )
+
+@functools.lru_cache(maxsize=1024)
+def parse_range_header(range_header: str):
+    """
+    Parse a Range header, caching the result since players keep sending the same ranges.
+
+    Args:
+        range_header (str): The Range header value.
+
+    Returns:
+        A (start, end) tuple as returned by tornado, or None if the header is invalid.
+    """
+    return httputil._parse_request_range(range_header)
+
+def get_largest_thumbnail(thumbnails: dict) -> str:
+    """
+    Get the key of the largest thumbnail.
+
+    Args:
+        thumbnails (dict): The 'thumbnails' object of a YouTube Data API snippet.
+
+    Returns:
+        The key of the widest thumbnail.
+    """
+    for key in THUMBNAIL_SIZES:
+        if key in thumbnails:
+            return key
+    return max(thumbnails, key=lambda x: thumbnails[x]['width'])
+
+def serialize_feed(fg: FeedGenerator) -> dict:
+    """
+    Serialize the feed, compress it and hash its ETag. This is CPU-bound, so the handlers run it in the executor.
+
+    Args:
+        fg (FeedGenerator): The complete feed.
+
+    Returns:
+        The cache entry's 'feed', 'feed_gzip' and 'etag'.
+    """
+    feed_bytes = fg.rss_str()
+    return {
+        'feed': feed_bytes,
+        'feed_gzip': gzip.compress(feed_bytes, compresslevel=6),
+        'etag': '"%s"' % hashlib.sha1(feed_bytes).hexdigest()
+    }
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Check if an Accept-Encoding header value allows a gzip body, honouring q-values (RFC 7231 section 5.3.4):
+    'gzip;q=0' refuses it, and an explicit gzip entry takes precedence over '*'.
+
+    Args:
+        accept_encoding (str): The Accept-Encoding header value.
+
+    Returns:
+        True if gzip is acceptable.
+    """
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        qvalue = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding] = qvalue
+    return qvalues.get('gzip', qvalues.get('x-gzip', qvalues.get('*', 0.0))) > 0
+
+def write_feed(handler: web.RequestHandler, feed: dict):
+    """
+    Write a cached feed, or an empty 304 response if the client already has it.
+    The ETag is hashed and the gzip body compressed once when the feed is built instead of on every request.
+
+    Args:
+        handler (web.RequestHandler): The handler serving the feed.
+        feed (dict): The cached feed with its 'feed' and 'feed_gzip' bodies and 'etag'.
+    """
+    # rss is not among the types the application's gzip transform compresses (it still adds Vary), so it is done here
+    if accepts_gzip(handler.request.headers.get('Accept-Encoding', '')):
+        handler.set_header('Content-Encoding', 'gzip')
+        handler.set_header('Etag', feed['etag'][:-1] + '-gzip"')
+        body = feed['feed_gzip']
+    else:
+        handler.set_header('Etag', feed['etag'])
+        body = feed['feed']
+    if handler.check_etag_header():
+        handler.set_status(304)
+    else:
+        handler.write(body)
+    handler.finish()
 
 def set_key(new_key: str = None):
     """
@@ -107,80 +307,161 @@ def set_key(new_key: str = None):
     global KEY
     KEY = new_key
 
+def cache_put(cache: OrderedDict, key: str, value: dict):
+    """
+    Store an entry as the most recently used one and drop the least recently used entries over CACHE_MAX_SIZE.
+
+    Args:
+        cache (OrderedDict): The cache to store the entry in.
+        key (str): The entry key.
+        value (dict): The entry with its 'expire' datetime.
+    """
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CACHE_MAX_SIZE:
+        cache.popitem(last=False)
+
+def remove_expired(cache: dict, current_time: datetime.datetime) -> int:
+    """
+    Delete the expired entries of the cache in place.
+
+    Args:
+        cache (dict): The cache whose values have an 'expire' datetime.
+        current_time (datetime.datetime): The time to compare the expiration against.
+
+    Returns:
+        The number of deleted entries.
+    """
+    expired = [key for key, info in cache.items() if info['expire'] <= current_time]
+    for key in expired:
+        del cache[key]
+    return len(expired)
+
+def remove_file(path: str, log_level: int = logging.DEBUG):
+    """
+    Remove a file if it exists, logging the outcome.
+
+    Args:
+        path (str): The file to remove.
+        log_level (int): The level to log a successful removal at.
+    """
+    try:
+        os.unlink(path)
+        logging.log(log_level, 'Deleted %s', path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.error('Error remove file %s: %s', path, e)
+
+def get_files_info(directory: str, suffix: str) -> list:
+    """
+    List the files of the directory whose names end with the suffix, like glob(f'{directory}/*{suffix}'),
+    reading each file's ctime and size from a single stat call.
+
+    Args:
+        directory (str): The directory to scan.
+        suffix (str): The file name suffix to match.
+
+    Returns:
+        A list of (ctime, path, size) tuples. Empty if the directory does not exist.
+    """
+    files = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffix) and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    files.append((stat.st_ctime, entry.path, stat.st_size))
+    except FileNotFoundError:
+        pass
+    return files
+
+def format_size(size: int) -> str:
+    """
+    Format a file size with a binary unit for the cache page.
+
+    Args:
+        size (int): The size in bytes.
+
+    Returns:
+        The size like '3MiB'.
+    """
+    # every 10 bits of the size is one binary unit step
+    unit = min(max(size.bit_length() - 1, 0) // 10, len(SIZE_UNITS) - 1)
+    return str(size >> (unit * 10)) + SIZE_UNITS[unit]
+
+
+@gen.coroutine
 def cleanup():
     """
     Clean up expired video links, playlist feeds, channel feeds, and channel name map.
     Delete audio files older than a certain time.
     Logs the items cleaned from each category.
     """
-    # Globals
-    global video_links, playlist_feed, channel_name_to_id, channel_feed, AUDIO_EXPIRATION_TIME, AUDIO_DIR, VIDEO_DIR
     current_time = datetime.datetime.now()
     # Video Links
-    video_links_length = len(video_links)
-    video_links = {
-        video:
-            info
-            for video, info in video_links.items()
-            if info['expire'] > current_time
-    }
-    video_links_length -= len(video_links)
+    video_links_length = remove_expired(video_links, current_time)
     if video_links_length:
         logging.info('Cleaned %s items from video list', video_links_length)
     # Playlist Feeds
-    playlist_feed_length = len(playlist_feed)
-    playlist_feed = {
-        playlist:
-            info
-            for playlist, info in playlist_feed.items()
-            if info['expire'] > current_time
-    }
-    playlist_feed_length -= len(playlist_feed)
+    playlist_feed_length = remove_expired(playlist_feed, current_time)
     if playlist_feed_length:
         logging.info(
             'Cleaned %s items from playlist feeds',
             playlist_feed_length
         )
     # Channel Feeds
-    channel_feed_length = len(channel_feed)
-    channel_feed = {
-        channel:
-            info
-            for channel, info in channel_feed.items()
-            if info['expire'] > current_time
-    }
-    channel_feed_length -= len(channel_feed)
+    channel_feed_length = remove_expired(channel_feed, current_time)
     if channel_feed_length:
         logging.info(
             'Cleaned %s items from channel feeds',
             channel_feed_length
         )
     # Channel Feeds
-    channel_name_to_id_length = len(channel_name_to_id)
-    channel_name_to_id = {
-        channel:
-            info
-            for channel, info in channel_name_to_id.items()
-            if info['expire'] > current_time
-    }
-    channel_name_to_id_length -= len(channel_name_to_id)
+    channel_name_to_id_length = remove_expired(channel_name_to_id, current_time)
     if channel_name_to_id_length:
         logging.info(
             'Cleaned %s items from channel name map',
             channel_name_to_id_length
         )
+    # Channel Info
+    channel_info_length = remove_expired(channel_info, current_time)
+    if channel_info_length:
+        logging.info(
+            'Cleaned %s items from channel info',
+            channel_info_length
+        )
     # Space Check
     expired_time = time.time() - (AUDIO_EXPIRATION_TIME / 1000)
-    for f in sorted(glob.glob(f'{AUDIO_DIR}/*mp3') + glob.glob(f'{VIDEO_DIR}/*mp4'), key=lambda a_file: os.path.getctime(a_file)):
-        ctime = os.path.getctime(f)
-        if ctime <= expired_time:
-            try:
-                os.remove(f)
-                logging.info('Deleted %s', f)
-            except Exception as ex:
-                logging.error('Error remove file %s: %s', f, ex)
-        else:
-            break
+    # scanning and unlinking touch the disk, keep them off the ioloop
+    io_loop = ioloop.IOLoop.current()
+    files = yield io_loop.run_in_executor(
+        None,
+        lambda: get_files_info(AUDIO_DIR, 'mp3') + get_files_info(VIDEO_DIR, 'mp4')
+    )
+    yield [
+        io_loop.run_in_executor(None, remove_file, f, logging.INFO)
+        for ctime, f, _ in files
+        if ctime <= expired_time
+    ]
+    touch_time = time.time() - AUDIO_TOUCH_INTERVAL
+    for f in [f for f, last_touch in audio_last_touch.items() if last_touch <= touch_time]:
+        del audio_last_touch[f]
+
+def enqueue_conversion(video: str):
+    """
+    Add the video to the conversion queue and schedule its conversion.
+
+    Args:
+        video (str): Youtube video's key.
+    """
+    conversion_queue[video] = {
+        'status': False,
+        'added': datetime.datetime.now(),
+        'done': Event()
+    }
+    # one convert_videos call per queued video, so nothing has to poll the queue
+    ioloop.IOLoop.current().add_callback(convert_videos)
 
 @gen.coroutine
 def convert_videos():
@@ -190,24 +471,15 @@ def convert_videos():
     and then initiates the conversion process. 
     If an error occurs during the conversion, it handles the error and cleans up any temporary files.
     """
-    global conversion_queue
-    global converting_lock
     if len(conversion_queue) == 0:
         return
-    try:
-        remaining = [
-            key
-            for key in conversion_queue.keys()
-            if not conversion_queue[key]['status']
-        ]
-        video = sorted(
-            remaining,
-            key=lambda v: conversion_queue[v]['added']
-        )[0]
-        conversion_queue[video]['status'] = True
-    except Exception:
-        return
+    # take a permit before picking, so a video is only marked as converting once it really starts
     with (yield converting_lock.acquire()):
+        # entries are added with the current time, so insertion order is the 'added' order
+        video = next((key for key, info in conversion_queue.items() if not info['status']), None)
+        if video is None:
+            return
+        conversion_queue[video]['status'] = True
         logging.info('Start downloading: %s', video)
         try:
             yield download_youtube_audio(video)
@@ -217,15 +489,35 @@ def convert_videos():
                 errorType = "Video is Live Stream" if isinstance(ex, exceptions.LiveStreamError) else "Video is Unavailable"
                 logging.error('Error converting file: %s', errorType)
                 if video not in video_links:
-                    video_links[video] = {
+                    cache_put(video_links, video, {
                         'url': None,
                         'expire': datetime.datetime.now() + datetime.timedelta(hours=6)
-                    }
+                    })
                 video_links[video]['unavailable'] = True
             else:
                 logging.exception('Error converting file: %s', ex)
         finally:
-            del conversion_queue[video]
+            conversion_queue.pop(video)['done'].set()
+
+def download_progress_logger(kind: str, video: str):
+    """
+    Make a pytube progress callback that logs once per downloaded megabyte instead of on every chunk.
+
+    Args:
+        kind (str): The stream kind for the log message.
+        video (str): Youtube video's key.
+
+    Returns:
+        The callback for YouTube.register_on_progress_callback.
+    """
+    downloaded = 0
+    def on_progress(stream, chunk, bytes_remaining):
+        nonlocal downloaded
+        previous = downloaded
+        downloaded += len(chunk)
+        if downloaded >> 20 != previous >> 20 or not bytes_remaining:
+            logging.debug('Downloading %s %s: downloaded %s, remain %s', kind, video, downloaded, bytes_remaining)
+    return on_progress
 
 async def download_youtube_audio(video: str):
     """
@@ -234,8 +526,7 @@ async def download_youtube_audio(video: str):
     Args:
         video (str): Youtube video's key.
     """
-    global PROXIES, USE_OAUTH, AUDIO_DIR
-    yturl = get_youtube_url(video)
+    yturl = YOUTUBE_WATCH_URL + video
     logging.debug("Full URL: %s", yturl)
 
     audio_file = f'{AUDIO_DIR}/{video}.mp3'
@@ -243,7 +534,6 @@ async def download_youtube_audio(video: str):
     video_file = None
 
     try:
-        Path(AUDIO_DIR).mkdir(parents=True, exist_ok=True)
         logging.debug('Start downloading audio stream: %s', video)
 
         yt = YouTube(
@@ -253,17 +543,10 @@ async def download_youtube_audio(video: str):
             proxies=PROXIES
         )
         if logging.root.isEnabledFor(logging.DEBUG):
-            yt.register_on_progress_callback(
-                lambda stream, chunk, bytes_remaining:
-                    logging.debug('Downloading audio %s: downloaded %s, remain %s', video, len(chunk), bytes_remaining)
-            )
+            yt.register_on_progress_callback(download_progress_logger('audio', video))
         yt.streams.get_audio_only().download(filename=audio_file_temp, max_retries=5)
 
-        try:
-            os.rename(audio_file_temp, audio_file)
-        except (OSError, SystemError) as e:
-            logging.error('Error rename temp file: %s', e)
-            raise e
+        os.replace(audio_file_temp, audio_file)
 
         logging.debug('Successfully downloaded audio: %s', video)
 
@@ -273,20 +556,14 @@ async def download_youtube_audio(video: str):
     except Exception as e:
         logging.debug( "Error returned by Youtube: %s", e )
         try:
-            try:
-                if os.path.exists(audio_file_temp):
-                    os.remove(audio_file_temp)
-                if os.path.exists(audio_file):
-                    os.remove(audio_file)
-            except Exception as e2:
-                logging.error('Error remove file: %s', e2)
-                raise e2
+            remove_file(audio_file_temp)
+            remove_file(audio_file)
 
             video_file = download_youtube_video(video)
 
             logging.debug('Start converting video: %s', video)
             ffmpeg_process = process.Subprocess([
-                'ffmpeg',
+                FFMPEG_BIN,
                 '-loglevel', 'panic',
                 '-y',
                 '-i', video_file,
@@ -294,30 +571,18 @@ async def download_youtube_audio(video: str):
             ])
             await ffmpeg_process.wait_for_exit()
 
-            try:
-                os.rename(audio_file_temp, audio_file)
-            except (OSError, SystemError) as e:
-                logging.error('Error rename temp file: %s', e)
-                raise e
+            os.replace(audio_file_temp, audio_file)
 
             logging.debug('Successfully converted video: %s', video)
 
         except Exception as e2:
-            try:
-                if os.path.exists(audio_file):
-                    os.remove(audio_file)
-            except Exception as e3:
-                logging.error('Error remove temp file: %s', e3)
+            remove_file(audio_file)
             raise e2
 
     finally:
-        try:
-            if os.path.exists(audio_file_temp):
-                os.remove(audio_file_temp)
-            if video_file and os.path.exists(video_file):
-                os.remove(video_file)
-        except Exception as e:
-            logging.error('Error remove temp file: %s', e)
+        remove_file(audio_file_temp)
+        if video_file:
+            remove_file(video_file)
 
 def download_youtube_video(video) -> str:
     """
@@ -329,15 +594,13 @@ def download_youtube_video(video) -> str:
     Return (str):
         Path to downloaded video file.
     """
-    global PROXIES, USE_OAUTH, VIDEO_DIR
-    yturl = get_youtube_url(video)
+    yturl = YOUTUBE_WATCH_URL + video
     logging.debug("Full URL: %s", yturl)
 
     video_file = f'{VIDEO_DIR}/{video}.mp4'
     video_file_temp = video_file + '.temp'
 
     try:
-        Path(VIDEO_DIR).mkdir(parents=True, exist_ok=True)
         logging.debug('Start downloading video stream: %s', video)
         yt = YouTube(
             yturl,
@@ -346,47 +609,24 @@ def download_youtube_video(video) -> str:
             proxies=PROXIES
         )
         if logging.root.isEnabledFor(logging.DEBUG):
-            yt.register_on_progress_callback(
-                lambda stream, chunk, bytes_remaining:
-                    logging.debug('Downloading video %s: downloaded %s, remain %s', video, len(chunk), bytes_remaining)
-            )
+            yt.register_on_progress_callback(download_progress_logger('video', video))
         logging.debug( "Stream count: %s", len(yt.streams))
         stream = yt.streams.get_by_resolution("720p", progressive=False)
         if not stream:
             stream = yt.streams.get_highest_resolution(progressive=False)
         stream.download(filename=video_file_temp, max_retries=5)
 
-        os.rename(video_file_temp, video_file)
+        os.replace(video_file_temp, video_file)
         logging.debug('Successfully downloaded video: %s', video)
 
     except Exception as e:
-        try:
-            if os.path.exists(video_file):
-                os.remove(video_file)
-        except Exception as ex2:
-            logging.error('Error remove temp file: %s', ex2)
+        remove_file(video_file)
         raise e
 
     finally:
-        try:
-            if os.path.exists(video_file_temp):
-                os.remove(video_file_temp)
-        except Exception as ex2:
-            logging.error('Error remove temp file: %s', ex2)
+        remove_file(video_file_temp)
     return video_file
 
-def get_youtube_url(video: str) -> str:
-    """
-    Function to get the YouTube URL for a given video.
-
-    Args:
-    - video: The video ID for which the URL is needed.
-
-    Returns:
-    - The YouTube URL for the given video.
-    """
-    return "https://www.youtube.com/watch?v=%s" % video
-
 class ChannelHandler(web.RequestHandler):
     def initialize(self, video_handler_path: str, audio_handler_path: str, default_item_type: str = "audio"):
         """
@@ -425,7 +665,6 @@ class ChannelHandler(web.RequestHandler):
         Return types:
             - None
         """
-        global KEY, PROXIES
         max_pages = self.get_argument('max', None)
         if max_pages:
             logging.info("Will grab videos from a maximum of %s pages" % max_pages)
@@ -443,50 +682,58 @@ class ChannelHandler(web.RequestHandler):
             channel.append(self.default_item_type)
         channel_name = ['/'.join(channel)]
         self.set_header('Content-type', 'application/rss+xml')
-        if channel_name[0] in channel_feed and channel_feed[channel_name[0]]['expire'] > datetime.datetime.now():
-            self.write(channel_feed[channel_name[0]]['feed'])
-            self.finish()
+        feed = channel_feed.get(channel_name[0])
+        if feed and feed['expire'] > datetime.datetime.now():
+            channel_feed.move_to_end(channel_name[0])
+            write_feed(self, feed)
             return
         fg = None
         video = None
         calls = 0
-        payload = {
-            'part': 'snippet,contentDetails',
-            'maxResults': 1,
-            'fields': 'items',
-            'order': 'date',
-            'id': channel[0],
-            'key': KEY
-        }
-        request = requests.get(
-            'https://www.googleapis.com/youtube/v3/channels',
-            params=payload,
-            proxies=PROXIES
-        )
-        calls += 1
-        if request.status_code != 200:
+        # the channel id, uploads playlist and snippet rarely change, skip the channel lookup while they are cached
+        if channel[0] in channel_info and channel_info[channel[0]]['expire'] > datetime.datetime.now():
+            channel_info.move_to_end(channel[0])
+            channel_data = channel_info[channel[0]]['data']
+        else:
             payload = {
                 'part': 'snippet,contentDetails',
                 'maxResults': 1,
                 'fields': 'items',
                 'order': 'date',
-                'forUsername': channel[0],
+                'id': channel[0],
                 'key': KEY
             }
-            request = requests.get(
+            request = yield api_get(
                 'https://www.googleapis.com/youtube/v3/channels',
-                params=payload,
-                proxies=PROXIES
+                payload
             )
             calls += 1
-        if request.status_code == 200:
-            logging.debug('Downloaded Channel Information')
-        else:
-            logging.error('Error Downloading Channel: %s', request.reason)
-            self.send_error(reason='Error Downloading Channel')
-            return
-        response = request.json()
-        channel_data = response['items'][0]
+            if request.status_code != 200:
+                payload = {
+                    'part': 'snippet,contentDetails',
+                    'maxResults': 1,
+                    'fields': 'items',
+                    'order': 'date',
+                    'forUsername': channel[0],
+                    'key': KEY
+                }
+                request = yield api_get(
+                    'https://www.googleapis.com/youtube/v3/channels',
+                    payload
+                )
+                calls += 1
+            if request.status_code == 200:
+                logging.debug('Downloaded Channel Information')
+            else:
+                logging.error('Error Downloading Channel: %s', request.reason)
+                self.send_error(reason='Error Downloading Channel')
+                return
+            response = json_loads(request.content)
+            channel_data = response['items'][0]
+            cache_put(channel_info, channel[0], {
+                'data': channel_data,
+                'expire': datetime.datetime.now() + datetime.timedelta(hours=24)
+            })
         if channel[0] != channel_data['id']:
             channel[0] = channel_data['id']
             channel_name.append('/'.join(channel))
@@ -509,10 +756,7 @@ class ChannelHandler(web.RequestHandler):
             channel[0],
             channel_data['title']
         )
-        icon = max(
-            channel_data['thumbnails'],
-            key=lambda x: channel_data['thumbnails'][x]['width']
-        )
+        icon = get_largest_thumbnail(channel_data['thumbnails'])
         fg.title(channel_data['title'])
         fg.id(f'{self.request.protocol}://{self.request.host}{self.request.uri}')
         fg.description(channel_data['description'] or ' ')
@@ -539,33 +783,32 @@ class ChannelHandler(web.RequestHandler):
 
         response = {'nextPageToken': ''}
         page_count = items_count = 0
+        next_request = None
+        host_url = f'{self.request.protocol}://{self.request.host}'
+        video_url_prefix = host_url + self.video_handler_path
+        audio_url_prefix = host_url + self.audio_handler_path
         while 'nextPageToken' in response.keys() and (max_items < 1 or items_count < max_items):
             page_count += 1
             if max_pages and page_count > int(max_pages):
                 logging.info("Reached maximum number of pages. Stopping here.")
                 break
-            next_page = response['nextPageToken']
-            payload = {
-                'part': 'snippet,contentDetails',
-                'maxResults': 50 if max_items < 1 or max_items - items_count > 50 else max_items - items_count,
-                'playlistId': channel_upload_list,
-                'key': KEY,
-                'pageToken': next_page
-            }
-            request = requests.get(
-                'https://www.googleapis.com/youtube/v3/playlistItems',
-                params=payload,
-                proxies=PROXIES
-            )
+            if next_request is None:
+                next_request = get_playlist_items(channel_upload_list, 'snippet,contentDetails', UPLOAD_ITEM_FIELDS, response['nextPageToken'], max_items, items_count)
+            request = yield next_request
+            next_request = None
             calls += 1
-            response = request.json()
+            response = json_loads(request.content)
             if request.status_code == 200:
                 logging.debug('Downloaded Channel Information')
             else:
                 logging.error('Error Downloading Channel: %s', request.reason)
                 self.send_error(reason='Error Downloading Channel')
                 return
-            for item in response['items']:
+            # Fetch the next page while this one is turned into feed entries
+            expected_count = items_count + len(response.get('items', ()))
+            if 'nextPageToken' in response and (max_items < 1 or expected_count < max_items) and not (max_pages and page_count >= int(max_pages)):
+                next_request = get_playlist_items(channel_upload_list, 'snippet,contentDetails', UPLOAD_ITEM_FIELDS, response['nextPageToken'], max_items, expected_count)
+            for item in response.get('items', ()):
                 snippet = item['snippet']
                 if 'private' in snippet['title'].lower():
                     continue
@@ -586,55 +829,51 @@ class ChannelHandler(web.RequestHandler):
                 items_count += 1
                 fe.title(snippet['title'])
                 fe.id(current_video)
-                icon = max(
-                    snippet['thumbnails'],
-                    key=lambda x: snippet['thumbnails'][x]['width'])
-                fe.podcast.itunes_image(snippet['thumbnails'][icon]['url'])
+                # partial responses drop empty objects, so an entry without thumbnails has no key at all
+                thumbnails = snippet.get('thumbnails')
+                if thumbnails:
+                    icon = get_largest_thumbnail(thumbnails)
+                    fe.podcast.itunes_image(thumbnails[icon]['url'])
                 fe.updated(snippet['publishedAt'])
                 if channel[1] == 'video':
                     fe.enclosure(
-                        url=f'{self.request.protocol}://{self.request.host}{self.video_handler_path}{current_video}',
+                        url=video_url_prefix + current_video,
                         type="video/mp4"
                     )
                 elif channel[1] == 'audio':
                     fe.enclosure(
-                        url=f'{self.request.protocol}://{self.request.host}{self.audio_handler_path}{current_video}',
+                        url=audio_url_prefix + current_video,
                         type="audio/mpeg"
                     )
                 fe.author(name=snippet['channelTitle'])
                 fe.podcast.itunes_author(snippet['channelTitle'])
                 fe.pubDate(snippet['publishedAt'])
                 fe.link(
-                    href=f'https://www.youtube.com/watch?v={current_video}',
+                    href=YOUTUBE_WATCH_URL + current_video,
                     title=snippet['title']
                 )
-                fe.podcast.itunes_summary(snippet['description'])
-                fe.description(snippet['description'])
+                fe.podcast.itunes_summary(snippet.get('description', ''))
+                fe.description(snippet.get('description', ''))
                 if not video or video['expire'] < fe.pubDate():
                     video = {'video': fe.id(), 'expire': fe.pubDate()}
-        feed = {
-            'feed': fg.rss_str(),
+        feed = yield ioloop.IOLoop.current().run_in_executor(None, serialize_feed, fg)
+        feed.update({
             'expire': datetime.datetime.now() + datetime.timedelta(hours=calls),
             'title': channel_data['title']
-        }
+        })
         for chan in channel_name:
-            channel_feed[chan] = feed
+            cache_put(channel_feed, chan, feed)
 
         logging.info("Got %s videos from %s pages" % (items_count, page_count))
 
-        self.write(feed['feed'])
-        self.finish()
+        write_feed(self, feed)
 
-        global AUTOLOAD_NEWEST_AUDIO, AUDIO_DIR
         if not AUTOLOAD_NEWEST_AUDIO:
             return
         video = video['video']
         mp3_file = f'{AUDIO_DIR}/{video}.mp3'
         if channel[1] == 'audio' and not os.path.exists(mp3_file) and video not in conversion_queue.keys():
-            conversion_queue[video] = {
-                'status': False,
-                'added': datetime.datetime.now()
-            }
+            enqueue_conversion(video)
 
 class PlaylistHandler(web.RequestHandler):
     def initialize(self, video_handler_path: str, audio_handler_path: str, default_item_type: str = "audio"):
@@ -670,15 +909,15 @@ class PlaylistHandler(web.RequestHandler):
         """
         A coroutine function to fetch a playlist and generate an RSS feed based on the playlist content.
         """
-        global KEY, PROXIES
         playlist = playlist.split('/')
         if len(playlist) < 2:
             playlist.append(self.default_item_type)
         playlist_name = '/'.join(playlist)
         self.set_header('Content-type', 'application/rss+xml')
-        if playlist_name in playlist_feed and playlist_feed[playlist_name]['expire'] > datetime.datetime.now():
-            self.write(playlist_feed[playlist_name]['feed'])
-            self.finish()
+        feed = playlist_feed.get(playlist_name)
+        if feed and feed['expire'] > datetime.datetime.now():
+            playlist_feed.move_to_end(playlist_name)
+            write_feed(self, feed)
             return
 
         try:
@@ -691,13 +930,13 @@ class PlaylistHandler(web.RequestHandler):
         calls = 0
         payload = {
             'part': 'snippet',
+            'fields': PLAYLIST_FIELDS,
             'id': playlist[0],
             'key': KEY
         }
-        request = requests.get(
+        request = yield api_get(
             'https://www.googleapis.com/youtube/v3/playlists',
-            params=payload,
-            proxies=PROXIES
+            payload
         )
         calls += 1
         if request.status_code == 200:
@@ -706,7 +945,7 @@ class PlaylistHandler(web.RequestHandler):
             logging.error('Error Downloading Playlist: %s', request.reason)
             self.send_error(reason='Error Downloading Playlist')
             return
-        response = request.json()
+        response = json_loads(request.content)
         fg = FeedGenerator()
         fg.load_extension('podcast')
         fg.generator(
@@ -729,10 +968,9 @@ class PlaylistHandler(web.RequestHandler):
                 'id': snippet['channelId'],
                 'key': KEY
             }
-            request = requests.get(
+            request = yield api_get(
                 'https://www.googleapis.com/youtube/v3/channels',
-                params=payload,
-                proxies=PROXIES
+                payload
             )
             calls += 1
             if request.status_code != 200:
@@ -742,10 +980,9 @@ class PlaylistHandler(web.RequestHandler):
                     'forUsername': snippet['channelId'],
                     'key': KEY
                 }
-                request = requests.get(
+                request = yield api_get(
                     'https://www.googleapis.com/youtube/v3/channels',
-                    params=payload,
-                    proxies=PROXIES
+                    payload
                 )
                 calls += 1
             if request.status_code == 200:
@@ -755,22 +992,15 @@ class PlaylistHandler(web.RequestHandler):
                 self.send_error(reason='Error Downloading Playlist')
                 return
 
-            response = request.json()
+            response = json_loads(request.content)
             channel_data = response['items'][0]['snippet']
-            icon_key = max(
-                channel_data['thumbnails'],
-                key=lambda x: channel_data['thumbnails'][x]['width']
-            )
+            icon_key = get_largest_thumbnail(channel_data['thumbnails'])
             icon_url = channel_data['thumbnails'][icon_key]['url']
             if 'title' in channel_data:
                 title = channel_data['title']
             if 'description' in channel_data:
                 description = channel_data['description']
 
-        icon = max(
-            snippet['thumbnails'],
-            key=lambda x: snippet['thumbnails'][x]['width']
-        )
         playlist_title = f"{snippet['channelTitle']}: {snippet['title']}"
         logging.info(
             'Playlist: %s (%s)',
@@ -780,12 +1010,9 @@ class PlaylistHandler(web.RequestHandler):
         if not title:
             title = playlist_title
         if not description:
-            description = snippet['description'] or ' '
+            description = snippet.get('description') or ' '
         if not icon_url:
-            icon = max(
-                snippet['thumbnails'],
-                key=lambda x: snippet['thumbnails'][x]['width']
-            )
+            icon = get_largest_thumbnail(snippet['thumbnails'])
             icon_url = snippet['thumbnails'][icon]['url']
 
         fg.title(title)
@@ -809,34 +1036,34 @@ class PlaylistHandler(web.RequestHandler):
             name='Podtube',
             email='armware+podtube@gmail.com'
         )
-        fg.podcast.itunes_summary(snippet['description'])
+        fg.podcast.itunes_summary(snippet.get('description', ''))
         fg.podcast.itunes_category(cat='Technology')
         fg.updated(str(datetime.datetime.utcnow()) + 'Z')
         video = None
         response = {'nextPageToken': ''}
         items_count = 0
+        next_request = None
+        host_url = f'{self.request.protocol}://{self.request.host}'
+        video_url_prefix = host_url + self.video_handler_path
+        audio_url_prefix = host_url + self.audio_handler_path
         while 'nextPageToken' in response.keys() and (max_items < 1 or items_count < max_items):
-            payload = {
-                'part': 'snippet',
-                'maxResults': 50 if max_items < 1 or max_items - items_count > 50 else max_items - items_count,
-                'playlistId': playlist[0],
-                'key': KEY,
-                'pageToken': response['nextPageToken']
-            }
-            request = requests.get(
-                'https://www.googleapis.com/youtube/v3/playlistItems',
-                params=payload,
-                proxies=PROXIES
-            )
+            if next_request is None:
+                next_request = get_playlist_items(playlist[0], 'snippet', PLAYLIST_ITEM_FIELDS, response['nextPageToken'], max_items, items_count)
+            request = yield next_request
+            next_request = None
             calls += 1
-            response = request.json()
+            response = json_loads(request.content)
             if request.status_code == 200:
                 logging.debug('Downloaded Playlist Information')
             else:
                 logging.error('Error Downloading Playlist: %s', request.reason)
                 self.send_error(reason='Error Downloading Playlist Items')
                 return
-            for item in response['items']:
+            # Fetch the next page while this one is turned into feed entries
+            expected_count = items_count + len(response.get('items', ()))
+            if 'nextPageToken' in response and (max_items < 1 or expected_count < max_items):
+                next_request = get_playlist_items(playlist[0], 'snippet', PLAYLIST_ITEM_FIELDS, response['nextPageToken'], max_items, expected_count)
+            for item in response.get('items', ()):
                 snippet = item['snippet']
                 current_video = snippet['resourceId']['videoId']
                 if 'Private' in snippet['title']:
@@ -849,22 +1076,21 @@ class PlaylistHandler(web.RequestHandler):
                 fe = fg.add_entry()
                 fe.title(snippet['title'])
                 fe.id(current_video)
-                if snippet['thumbnails']:
-                    icon = max(
-                        snippet['thumbnails'],
-                        key=lambda x: snippet['thumbnails'][x]['width']
-                    )
-                    fe.podcast.itunes_image(snippet['thumbnails'][icon]['url'])
+                # deleted and unavailable videos come without thumbnails, partial responses drop the empty object
+                thumbnails = snippet.get('thumbnails')
+                if thumbnails:
+                    icon = get_largest_thumbnail(thumbnails)
+                    fe.podcast.itunes_image(thumbnails[icon]['url'])
                 fe.updated(snippet['publishedAt'])
                 final_url = None
                 if playlist[1] == 'video':
-                    final_url = f'{self.request.protocol}://{self.request.host}{self.video_handler_path}{current_video}'
+                    final_url = video_url_prefix + current_video
                     fe.enclosure(
                         url=final_url,
                         type="video/mp4"
                     )
                 elif playlist[1] == 'audio':
-                    final_url = f'{self.request.protocol}://{self.request.host}{self.audio_handler_path}{current_video}'
+                    final_url = audio_url_prefix + current_video
                     fe.enclosure(
                         url=final_url,
                         type="audio/mpeg"
@@ -874,32 +1100,27 @@ class PlaylistHandler(web.RequestHandler):
                 fe.podcast.itunes_author(snippet['channelTitle'])
                 fe.pubDate(snippet['publishedAt'])
                 fe.link(
-                    href=f'https://www.youtube.com/watch?v={current_video}',
+                    href=YOUTUBE_WATCH_URL + current_video,
                     title=snippet['title']
                 )
-                fe.podcast.itunes_summary(snippet['description'])
-                fe.description(snippet['description'])
+                fe.podcast.itunes_summary(snippet.get('description', ''))
+                fe.description(snippet.get('description', ''))
                 if not video or video['expire'] < fe.pubDate():
                     video = {'video': fe.id(), 'expire': fe.pubDate()}
                 items_count = items_count + 1
-        feed = {
-            'feed': fg.rss_str(),
+        feed = yield ioloop.IOLoop.current().run_in_executor(None, serialize_feed, fg)
+        feed.update({
             'expire': datetime.datetime.now() + datetime.timedelta(hours=calls),
             'title': playlist_data['title']
-        }
-        playlist_feed[playlist_name] = feed
-        self.write(feed['feed'])
-        self.finish()
-        global AUTOLOAD_NEWEST_AUDIO, AUDIO_DIR
+        })
+        cache_put(playlist_feed, playlist_name, feed)
+        write_feed(self, feed)
         if not AUTOLOAD_NEWEST_AUDIO:
             return
         video = video['video']
         mp3_file = f'{AUDIO_DIR}/{video}.mp3'
         if playlist[1] == 'audio' and not os.path.exists(mp3_file) and video not in conversion_queue.keys():
-            conversion_queue[video] = {
-                'status': False,
-                'added': datetime.datetime.now()
-            }
+            enqueue_conversion(video)
 
 class VideoHandler(web.RequestHandler):
     def get(self, video):
@@ -913,7 +1134,7 @@ class VideoHandler(web.RequestHandler):
             None
         """
         logging.info('Getting Video: %s', video)
-        yt_url = get_youtube_url(video)
+        yt_url = YOUTUBE_WATCH_URL + video
         logging.debug("Redirect to %s", yt_url)
         self.redirect( yt_url )
 
@@ -923,6 +1144,7 @@ class AudioHandler(web.RequestHandler):
         Initialize the object.
         """
         self.disconnected = False
+        self.conversion_wait = None
 
     @gen.coroutine
     def head(self, audio):
@@ -944,7 +1166,6 @@ class AudioHandler(web.RequestHandler):
         """
         A coroutine function that handles the GET request for audio files. It checks if the requested audio is available and, if so, streams the audio content to the client. If the audio is not available or an error occurs during the conversion, appropriate status codes are set and returned.
         """
-        global AUDIO_DIR
         logging.info('Audio: %s (%s)', audio, self.request.remote_ip)
         if audio in video_links and 'unavailable' in video_links[audio] and video_links[audio]['unavailable'] == True:
             # logging.info('Audio: %s is not available (%s)', audio, self.request.remote_ip)
@@ -953,16 +1174,14 @@ class AudioHandler(web.RequestHandler):
         mp3_file = f'{AUDIO_DIR}/{audio}.mp3'
         if not os.path.exists(mp3_file):
             if audio not in conversion_queue.keys():
-                conversion_queue[audio] = {
-                    'status': False,
-                    'added': datetime.datetime.now()
-                }
-            while audio in conversion_queue:
-                yield gen.sleep(0.5)
-                if self.disconnected:
-                    # logging.info('User was disconnected while requested audio: %s (%s)', audio, self.request.remote_ip)
-                    self.set_status(408)
-                    return
+                enqueue_conversion(audio)
+            # woken by convert_videos when the conversion ends, or by on_connection_close
+            self.conversion_wait = conversion_queue[audio]['done'].wait()
+            yield self.conversion_wait
+            if self.disconnected:
+                # logging.info('User was disconnected while requested audio: %s (%s)', audio, self.request.remote_ip)
+                self.set_status(408)
+                return
         if audio in video_links and 'unavailable' in video_links[audio] and video_links[audio]['unavailable'] == True:
             # logging.info('Audio: %s is not available (%s)', audio, self.request.remote_ip)
             self.set_status(422) # Unprocessable Content. E.g. the video is a live stream
@@ -970,12 +1189,20 @@ class AudioHandler(web.RequestHandler):
         if not os.path.exists(mp3_file):
             self.set_status(404) # An error occurred during the conversion and the file was not created
             return
+        current_time = time.time()
+        if audio_last_touch.get(mp3_file, 0) <= current_time - AUDIO_TOUCH_INTERVAL:
+            # refreshes the ctime, so cleanup() keeps files that are still being listened to, also after a restart
+            try:
+                os.utime(mp3_file)
+            except OSError as e:
+                logging.error('Error touch file %s: %s', mp3_file, e)
+            audio_last_touch[mp3_file] = current_time
         request_range = None
         range_header = self.request.headers.get("Range")
         if range_header:
             # As per RFC 2616 14.16, if an invalid Range header is specified,
             # the request will be treated as if the header didn't exist.
-            request_range = httputil._parse_request_range(range_header)
+            request_range = parse_range_header(range_header)
 
         size = os.stat(mp3_file).st_size
         if request_range:
@@ -1006,14 +1233,7 @@ class AudioHandler(web.RequestHandler):
                 )
         else:
             start = end = None
-        if start is not None and end is not None:
-            content_length = end - start
-        elif end is not None:
-            content_length = end
-        elif start is not None:
-            content_length = size - start
-        else:
-            content_length = size
+        content_length = (size if end is None else end) - (start or 0)
         self.set_header("Accept-Ranges", "bytes")
         self.set_header("Content-Length", content_length)
         self.set_header('Content-Type', 'audio/mpeg')
@@ -1043,27 +1263,23 @@ class AudioHandler(web.RequestHandler):
 
         .. versionadded:: 3.1
         """
-        Path(abspath).touch(exist_ok=True)
         with open(abspath, "rb") as audio_file:
-            if start is not None:
-                audio_file.seek(start)
+            fd = audio_file.fileno()
+            offset = start or 0
             if end is not None:
-                remaining = end - (start or 0)
+                remaining = end - offset
             else:
-                remaining = None
-            while True:
-                chunk_size = 1024 ** 2
-                if remaining is not None and remaining < chunk_size:
-                    chunk_size = remaining
-                chunk = audio_file.read(chunk_size)
-                if chunk:
-                    if remaining is not None:
-                        remaining -= len(chunk)
-                    yield chunk
-                else:
-                    if remaining is not None:
-                        assert remaining == 0
+                remaining = os.fstat(fd).st_size - offset
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, offset, remaining, os.POSIX_FADV_SEQUENTIAL)
+            # positioned reads, no seek and no file object buffering
+            while remaining > 0:
+                chunk = os.pread(fd, min(AUDIO_CHUNK_SIZE, remaining), offset)
+                if not chunk:
                     return
+                offset += len(chunk)
+                remaining -= len(chunk)
+                yield chunk
 
     def on_connection_close(self):
         """
@@ -1071,6 +1287,8 @@ class AudioHandler(web.RequestHandler):
         """
         logging.warning('Audio: User quit during transcoding (%s)', self.request.remote_ip)
         self.disconnected = True
+        if self.conversion_wait is not None and not self.conversion_wait.done():
+            self.conversion_wait.set_result(None)
 
 class UserHandler(web.RequestHandler):
     def initialize(self, channel_handler_path: str):
@@ -1085,6 +1303,7 @@ class UserHandler(web.RequestHandler):
         """
         self.channel_handler_path = channel_handler_path
 
+    @gen.coroutine
     def get_canonical(self, url):
         """
         Get the canonical URL from the given input URL.
@@ -1095,26 +1314,22 @@ class UserHandler(web.RequestHandler):
         Returns:
             str: The canonical URL if found, otherwise None.
         """
-        global PROXIES
         logging.info("Getting canonical for %s" % url)
-        req = requests.get( url, proxies=PROXIES )
+        # the shared session keeps the connection to youtube alive; proxies are passed per request
+        # because requests lets HTTP(S)_PROXY from the environment override Session.proxies
+        req = yield ioloop.IOLoop.current().run_in_executor(None, functools.partial(SESSION.get, url, proxies=PROXIES, timeout=REQUEST_TIMEOUT))
         if req.status_code == 200:
-            from bs4 import BeautifulSoup
-            bs = BeautifulSoup( req.text, 'lxml' )
-            can_url = None
-
-            # loop through all links and find the canonical url
-            for link in bs.find_all("link"):
-                try:
-                    if link['rel'][0] == 'canonical':
-                        can_url = link['href']
-                        break
-                except:
-                    # not all links have a rel
-                    pass
-            return can_url
+            # the page is large and only one tag is needed, so search the raw bytes instead of parsing the html
+            link = CANONICAL_LINK_PATTERN.search(req.content)
+            if link is None:
+                return None
+            href = HREF_PATTERN.search(link.group())
+            if href is None:
+                return None
+            return html.unescape(href.group(1).decode())
         return None
 
+    @gen.coroutine
     def get_channel_token(self, username: str) -> str:
         """
         Get the channel token for the given username.
@@ -1125,22 +1340,23 @@ class UserHandler(web.RequestHandler):
         Returns:
             str: The channel token associated with the given username.
         """
-        global channel_name_to_id
         if username in channel_name_to_id and channel_name_to_id[username]['expire'] > datetime.datetime.now():
+            channel_name_to_id.move_to_end(username)
             return channel_name_to_id[username]['id']
         yt_url = f"https://www.youtube.com/@{username}/about"
-        canon_url = self.get_canonical( yt_url )
+        canon_url = yield self.get_canonical( yt_url )
         logging.debug('Canonical url: %s' % canon_url)
         if canon_url is None:
             return None
         token_index = canon_url.rfind("/") + 1
         channel_token = canon_url[token_index:]
-        channel_name_to_id[username] = {
+        cache_put(channel_name_to_id, username, {
             'id': channel_token,
             'expire': datetime.datetime.now() + datetime.timedelta(hours=24)
-        }
+        })
         return channel_token
 
+    @gen.coroutine
     def get(self, username):
         """
         A method to handle a Youtube channel by name and redirect to the corresponding URL.
@@ -1157,7 +1373,7 @@ class UserHandler(web.RequestHandler):
         if append_index > -1:
             append = username[append_index:]
             username = username[:append_index]
-        channel_token = self.get_channel_token(username)
+        channel_token = yield self.get_channel_token(username)
 
         if channel_token is None:
             logging.error("Failed to get canonical URL of %s" % username)
@@ -1178,98 +1394,66 @@ class ClearCacheHandler(web.RequestHandler):
     VIDEO_LINKS = "VIDEO_LINKS"
     PLAYLIST_FEED = "PLAYLIST_FEED"
     CHANNEL_FEED = "CHANNEL_FEED"
+    CHANNEL_INFO = "CHANNEL_INFO"
     CHANNEL_NAME_TO_ID = "CHANNEL_NAME_TO_ID"
 
+    # the caches are only ever cleared in place, so the table keeps pointing at the live dicts
+    CACHES = (
+        (VIDEO_LINKS, video_links, 'video list'),
+        (PLAYLIST_FEED, playlist_feed, 'playlist feeds'),
+        (CHANNEL_FEED, channel_feed, 'channel feeds'),
+        (CHANNEL_INFO, channel_info, 'channel info'),
+        (CHANNEL_NAME_TO_ID, channel_name_to_id, 'channel name map'),
+    )
+
     def post(self):
         """
         A description of the entire function, its parameters, and its return types.
         """
-        self.get()
+        return self.get()
 
+    @gen.coroutine
     def get(self):
         """
         A function to handle clearing the cache for various video and playlist items.
         """
-        global video_links, playlist_feed, channel_feed, channel_name_to_id, AUDIO_DIR, VIDEO_DIR
-
-        videoFile = self.get_argument(ClearCacheHandler.VIDEO_FILES, ClearCacheHandler.NONE, True)
-        audioFile = self.get_argument(ClearCacheHandler.AUDIO_FILES, ClearCacheHandler.NONE, True)
-        videoLink = self.get_argument(ClearCacheHandler.VIDEO_LINKS, ClearCacheHandler.NONE, True)
-        playlistFeed = self.get_argument(ClearCacheHandler.PLAYLIST_FEED, ClearCacheHandler.NONE, True)
-        channelFeed = self.get_argument(ClearCacheHandler.CHANNEL_FEED, ClearCacheHandler.NONE, True)
-        channelNameToId = self.get_argument(ClearCacheHandler.CHANNEL_NAME_TO_ID, ClearCacheHandler.NONE, True)
-
-        needClear = False
+        files = (
+            (ClearCacheHandler.VIDEO_FILES, VIDEO_DIR, 'mp4'),
+            (ClearCacheHandler.AUDIO_FILES, AUDIO_DIR, 'mp3'),
+        )
+        arguments = {
+            name: self.get_argument(name, ClearCacheHandler.NONE, True)
+            for name in [name for name, _, _ in files] + [name for name, _, _ in ClearCacheHandler.CACHES]
+        }
 
-        if any(element != ClearCacheHandler.NONE for element in [videoFile, audioFile, videoLink, playlistFeed, channelFeed, channelNameToId]):
+        needClear = any(value != ClearCacheHandler.NONE for value in arguments.values())
+        if needClear:
             logging.info('Force clear cache started (%s)', self.request.remote_ip)
-            needClear = True
 
-        if (videoFile == ClearCacheHandler.ALL):
-            for f in glob.glob(f'{VIDEO_DIR}/*mp4'):
+        for name, directory, suffix in files:
+            value = arguments[name]
+            if value == ClearCacheHandler.NONE:
+                continue
+            if value == ClearCacheHandler.ALL:
+                paths = glob.glob(f'{directory}/*{suffix}')
+            else:
+                paths = [f"{directory}/{value}"]
+            for f in paths:
                 try:
                     os.remove(f)
                     logging.info('Deleted %s', f)
                 except Exception as e:
                     logging.error('Error remove file %s: %s', f, e)
-        elif videoFile != ClearCacheHandler.NONE:
-            f = f"{VIDEO_DIR}/{videoFile}"
-            try:
-                os.remove(f)
-                logging.info('Deleted %s', f)
-            except Exception as e:
-                logging.error('Error remove file %s: %s', f, e)
 
-        if (audioFile == ClearCacheHandler.ALL):
-            for f in glob.glob(f'{AUDIO_DIR}/*mp3'):
-                try:
-                    os.remove(f)
-                    logging.info('Deleted %s', f)
-                except Exception as e:
-                    logging.error('Error remove file %s: %s', f, e)
-        elif audioFile != ClearCacheHandler.NONE:
-            f = f"{AUDIO_DIR}/{audioFile}"
-            try:
-                os.remove(f)
-                logging.info('Deleted %s', f)
-            except Exception as e:
-                logging.error('Error remove file %s: %s', f, e)
-
-        if (videoLink == ClearCacheHandler.ALL):
-            video_links_length = len(video_links)
-            video_links = {}
-            logging.info('Cleaned %s items from video list', video_links_length)
-        elif videoLink != ClearCacheHandler.NONE:
-            if videoLink in video_links:
-                del video_links[videoLink]
-                logging.info('Cleaned 1 items from video list')
-
-        if (playlistFeed == ClearCacheHandler.ALL):
-            playlist_feed_length = len(playlist_feed)
-            playlist_feed = {}
-            logging.info('Cleaned %s items from playlist feeds', playlist_feed_length)
-        elif playlistFeed != ClearCacheHandler.NONE:
-            if playlistFeed in playlist_feed:
-                del playlist_feed[playlistFeed]
-                logging.info('Cleaned 1 items from playlist feeds')
-
-        if (channelFeed == ClearCacheHandler.ALL):
-            channel_feed_length = len(channel_feed)
-            channel_feed = {}
-            logging.info('Cleaned %s items from channel feeds', channel_feed_length)
-        elif channelFeed != ClearCacheHandler.NONE:
-            if channelFeed in channel_feed:
-                del channel_feed[channelFeed]
-                logging.info('Cleaned 1 items from channel feeds')
-
-        if (channelNameToId == ClearCacheHandler.ALL):
-            channel_name_to_id_length = len(channel_name_to_id)
-            channel_name_to_id = {}
-            logging.info('Cleaned %s items from channel name map', channel_name_to_id_length)
-        elif channelNameToId != ClearCacheHandler.NONE:
-            if channelNameToId in channel_name_to_id:
-                del channel_name_to_id[channelNameToId]
-                logging.info('Cleaned 1 items from channel name map')
+        for name, cache, caption in ClearCacheHandler.CACHES:
+            value = arguments[name]
+            if value == ClearCacheHandler.ALL:
+                cache_length = len(cache)
+                cache.clear()
+                logging.info('Cleaned %s items from %s', cache_length, caption)
+            elif value != ClearCacheHandler.NONE and value in cache:
+                del cache[value]
+                logging.info('Cleaned 1 items from %s', caption)
 
         if needClear:
             selfurl = f'{self.request.protocol}://{self.request.host}{self.request.uri}'
@@ -1283,92 +1467,60 @@ class ClearCacheHandler(web.RequestHandler):
         self.write(f"<label>Clear cache</label>")
         self.write("<br/><br/>")
         self.write("<form method='POST'>")
-        self.write(f"<label for='{ClearCacheHandler.VIDEO_LINKS}'>Cached video links: </label>")
-        self.write(f"<select id='{ClearCacheHandler.VIDEO_LINKS}' name='{ClearCacheHandler.VIDEO_LINKS}'>")
-        self.write(f"<option value='{ClearCacheHandler.NONE}' selected>{ClearCacheHandler.NONE}</option>")
-        self.write(f"<option value='{ClearCacheHandler.ALL}'>{ClearCacheHandler.ALL}</option>")
-        for video, info in video_links.items():
-            self.write(f"<option value='{video}'>{video}</option>")
-        self.write("</select>")
-        self.write("<br/><br/>")
-
-        self.write(f"<label for='{ClearCacheHandler.PLAYLIST_FEED}'>Cached playlist feed: </label>")
-        self.write(f"<select id='{ClearCacheHandler.PLAYLIST_FEED}' name='{ClearCacheHandler.PLAYLIST_FEED}'>")
-        self.write(f"<option value='{ClearCacheHandler.NONE}' selected>{ClearCacheHandler.NONE}</option>")
-        self.write(f"<option value='{ClearCacheHandler.ALL}'>{ClearCacheHandler.ALL}</option>")
-        for playlist, info in playlist_feed.items():
-            caption = playlist
-            if 'title' in info:
-                caption = f"{info['title']} ({caption})"
-            self.write(f"<option value='{playlist}'>{caption}</option>")
-        self.write("</select>")
-        self.write("<br/><br/>")
-
-        self.write(f"<label for='{ClearCacheHandler.CHANNEL_FEED}'>Cached channel feed: </label>")
-        self.write(f"<select id='{ClearCacheHandler.CHANNEL_FEED}' name='{ClearCacheHandler.CHANNEL_FEED}'>")
-        self.write(f"<option value='{ClearCacheHandler.NONE}' selected>{ClearCacheHandler.NONE}</option>")
-        self.write(f"<option value='{ClearCacheHandler.ALL}'>{ClearCacheHandler.ALL}</option>")
-        for channel, info in channel_feed.items():
-            caption = channel
-            if 'title' in info:
-                caption = f"{info['title']} ({caption})"
-            self.write(f"<option value='{channel}'>{caption}</option>")
-        self.write("</select>")
-        self.write("<br/><br/>")
-
-        self.write(f"<label for='{ClearCacheHandler.CHANNEL_NAME_TO_ID}'>Cached channel name to id: </label>")
-        self.write(f"<select id='{ClearCacheHandler.CHANNEL_NAME_TO_ID}' name='{ClearCacheHandler.CHANNEL_NAME_TO_ID}'>")
-        self.write(f"<option value='{ClearCacheHandler.NONE}' selected>{ClearCacheHandler.NONE}</option>")
-        self.write(f"<option value='{ClearCacheHandler.ALL}'>{ClearCacheHandler.ALL}</option>")
-        for channel, info in channel_name_to_id.items():
-            self.write(f"<option value='{channel}'>@{channel}</option>")
-        self.write("</select>")
-        self.write("<br/><br/>")
-
-        self.write(f"<label for='{ClearCacheHandler.VIDEO_FILES}'>Cached video files: </label>")
-        self.write(f"<select id='{ClearCacheHandler.VIDEO_FILES}' name='{ClearCacheHandler.VIDEO_FILES}'>")
-        self.write(f"<option value='{ClearCacheHandler.NONE}' selected>{ClearCacheHandler.NONE}</option>")
-        self.write(f"<option value='{ClearCacheHandler.ALL}'>{ClearCacheHandler.ALL}</option>")
-        for f in sorted(glob.glob(f'{VIDEO_DIR}/*mp4'), key=lambda a_file: os.path.getctime(a_file)):
-            size = os.path.getsize(f)
-            if size > 10**12:
-                size = str(size // 2**40) + 'TiB'
-            elif size > 10**9:
-                size = str(size // 2**30) + 'GiB'
-            elif size > 10**6:
-                size = str(size // 2**20) + 'MiB'
-            elif size > 10**3:
-                size = str(size // 2**10) + 'KiB'
-            else:
-                size = str(size) + 'B'
-            f = os.path.basename(f)
-            self.write(f"<option value='{f}'>{f} ({size})</option>")
-        self.write("</select>")
-        self.write("<br/><br/>")
-
-        self.write(f"<label for='{ClearCacheHandler.AUDIO_FILES}'>Cached audio files: </label>")
-        self.write(f"<select id='{ClearCacheHandler.AUDIO_FILES}' name='{ClearCacheHandler.AUDIO_FILES}'>")
-        self.write(f"<option value='{ClearCacheHandler.NONE}' selected>{ClearCacheHandler.NONE}</option>")
-        self.write(f"<option value='{ClearCacheHandler.ALL}'>{ClearCacheHandler.ALL}</option>")
-        for f in sorted(glob.glob(f'{AUDIO_DIR}/*mp3'), key=lambda a_file: os.path.getctime(a_file)):
-            size = os.path.getsize(f)
-            if size > 10**12:
-                size = str(size // 2**40) + 'TiB'
-            elif size > 10**9:
-                size = str(size // 2**30) + 'GiB'
-            elif size > 10**6:
-                size = str(size // 2**20) + 'MiB'
-            elif size > 10**3:
-                size = str(size // 2**10) + 'KiB'
-            else:
-                size = str(size) + 'B'
-            f = os.path.basename(f)
-            self.write(f"<option value='{f}'>{f} ({size})</option>")
-        self.write("</select>")
-        self.write("<br/><br/>")
+        yield self.write_select(ClearCacheHandler.VIDEO_LINKS, 'Cached video links: ', (
+            (video, video) for video in video_links
+        ))
+        yield self.write_select(ClearCacheHandler.PLAYLIST_FEED, 'Cached playlist feed: ', (
+            (playlist, f"{info['title']} ({playlist})" if 'title' in info else playlist)
+            for playlist, info in playlist_feed.items()
+        ))
+        yield self.write_select(ClearCacheHandler.CHANNEL_FEED, 'Cached channel feed: ', (
+            (channel, f"{info['title']} ({channel})" if 'title' in info else channel)
+            for channel, info in channel_feed.items()
+        ))
+        yield self.write_select(ClearCacheHandler.CHANNEL_INFO, 'Cached channel info: ', (
+            (channel, f"{info['data']['snippet']['title']} ({channel})" if 'snippet' in info['data'] else channel)
+            for channel, info in channel_info.items()
+        ))
+        yield self.write_select(ClearCacheHandler.CHANNEL_NAME_TO_ID, 'Cached channel name to id: ', (
+            (channel, f"@{channel}") for channel in channel_name_to_id
+        ))
+        yield self.write_select(ClearCacheHandler.VIDEO_FILES, 'Cached video files: ', (
+            (os.path.basename(f), f"{os.path.basename(f)} ({format_size(size)})")
+            for _, f, size in sorted(get_files_info(VIDEO_DIR, 'mp4'))
+        ))
+        yield self.write_select(ClearCacheHandler.AUDIO_FILES, 'Cached audio files: ', (
+            (os.path.basename(f), f"{os.path.basename(f)} ({format_size(size)})")
+            for _, f, size in sorted(get_files_info(AUDIO_DIR, 'mp3'))
+        ))
 
         self.write("<input type='submit' value='CLEAR SELECTED CACHE' />")
         self.write("</form>")
         self.write("<br/>")
 
         self.write('</body></html>')
+
+    def write_select(self, name: str, label: str, options):
+        """
+        Write a labeled select offering NONE, ALL and the given options with a single write,
+        and flush it so the browser can render it while the next one is built.
+
+        Args:
+            name (str): The select's id and form field name.
+            label (str): The label text.
+            options: The (value, caption) pairs to offer.
+
+        Returns:
+            The flush future.
+        """
+        parts = [
+            f"<label for='{name}'>{label}</label>",
+            f"<select id='{name}' name='{name}'>",
+            f"<option value='{ClearCacheHandler.NONE}' selected>{ClearCacheHandler.NONE}</option>",
+            f"<option value='{ClearCacheHandler.ALL}'>{ClearCacheHandler.ALL}</option>",
+        ]
+        parts.extend(f"<option value='{value}'>{caption}</option>" for value, caption in options)
+        parts.append("</select>")
+        parts.append("<br/><br/>")
+        self.write(''.join(parts))
+        return self.flush()